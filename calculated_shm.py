@@ -0,0 +1,172 @@
+"""
+Shared memory publication of calculated data
+
+The plugin writes the values of each cycle into a file in /dev/shm, local
+processes map it and read consistent snapshots without locks and without
+talking to AvNav. This module contains the writer (used by plugin.py) and
+the reader, it has no dependencies besides the standard library.
+
+    from calculated_shm import Reader
+    r = Reader("avnav-calculated")
+    seq, t, data = r.read()  # data = {"TWA": -45.2, "TWS": 6.1, ...}
+
+## Layout (little endian)
+
+    offset  type          content
+    0       char[4]       magic "CDSM" ("DEAD" after the writer closed it)
+    4       uint32        layout version
+    8       uint64        sequence number, odd while the writer is busy
+    16      double        time of the cycle (unix time)
+    24      uint32        number of fields N
+    28      uint32        padding
+    32      char[16] * N  field names, zero padded
+    32+16N  double * N    values, NaN if not available
+
+Readers use the sequence number as seqlock: read it, copy time and values,
+read it again, and retry if it was odd or has changed in between.
+
+Limitation: Python cannot issue memory barriers, the writer uses plain
+stores. On strongly ordered CPUs (x86) this is a correct seqlock. On weakly
+ordered CPUs (ARM, e.g. Raspberry Pi) the stores of sequence number and
+values may become visible to a reader on another core in a different
+order, so in rare cases a snapshot can mix values of two cycles. Readers
+that cannot tolerate this should check plausibility (e.g. the time) or
+read twice. Readers in C should at least use acquire loads / barriers.
+
+If the writer stops without closing the segment (crash), the magic stays
+"CDSM", readers should treat snapshots with an old time as stale. A
+restarted writer replaces the file, readers compare the inode of the path
+with that of their mapping and map the new segment if they differ.
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import time
+from math import isnan, nan
+
+MAGIC = b"CDSM"
+CLOSED = b"DEAD"
+LAYOUT = 1
+HEADER = struct.Struct("<4sIQdII")
+SEQ = struct.Struct("<Q")
+SEQ_OFFSET = 8
+TIME = struct.Struct("<d")
+TIME_OFFSET = 16
+NAME = struct.Struct("<16s")
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def shm_path(name):
+    return name if "/" in name else os.path.join(SHM_DIR, name)
+
+
+class Publisher:
+    "writer side, one per segment"
+
+    def __init__(self, name, fields):
+        self.path = shm_path(name)
+        self.fields = tuple(fields)
+        n = len(self.fields)
+        self.values = struct.Struct(f"<{n}d")
+        self.values_offset = HEADER.size + NAME.size * n
+        size = self.values_offset + self.values.size
+        # write to a new file and rename it, readers never see a partial header
+        tmp = f"{self.path}.{os.getpid()}"
+        with open(tmp, "w+b") as f:
+            f.truncate(size)
+            self.mm = mmap.mmap(f.fileno(), size)
+        HEADER.pack_into(self.mm, 0, MAGIC, LAYOUT, 0, nan, n, 0)
+        for i, k in enumerate(self.fields):
+            NAME.pack_into(self.mm, HEADER.size + NAME.size * i, k.encode())
+        self.values.pack_into(self.mm, self.values_offset, *(nan,) * n)
+        os.replace(tmp, self.path)
+        self.seq = 0
+
+    def publish(self, data, t=None):
+        "write values of data (mapping, missing or not a number -> NaN)"
+        values = []
+        for k in self.fields:
+            v = data[k]
+            values.append(v if isinstance(v, (int, float)) else nan)
+        mm = self.mm
+        if mm is None:
+            return
+        SEQ.pack_into(mm, SEQ_OFFSET, self.seq + 1)
+        TIME.pack_into(mm, TIME_OFFSET, time.time() if t is None else t)
+        self.values.pack_into(mm, self.values_offset, *values)
+        self.seq += 2
+        SEQ.pack_into(mm, SEQ_OFFSET, self.seq)
+
+    def close(self):
+        if self.mm is None:
+            return
+        self.mm[0:4] = CLOSED
+        self.mm.close()
+        self.mm = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class Reader:
+    "reader side, maps the segment read-only"
+
+    def __init__(self, name):
+        self.path = shm_path(name)
+        self.mm = None
+
+    def open(self):
+        self.close()
+        with open(self.path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, layout, seq, t, n, _ = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or layout != LAYOUT:
+            self.close()
+            raise ValueError(f"invalid segment {self.path}")
+        self.fields = tuple(
+            NAME.unpack_from(self.mm, HEADER.size + NAME.size * i)[0]
+            .rstrip(b"\0")
+            .decode()
+            for i in range(n)
+        )
+        self.values = struct.Struct(f"<{n}d")
+        self.values_offset = HEADER.size + NAME.size * n
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    def snapshot(self, retries=1000):
+        "consistent (seq, time, values) with values as tuple in order of fields"
+        if (
+            self.mm is None
+            or self.mm[0:4] != MAGIC
+            or os.stat(self.path).st_ino != self.inode
+        ):
+            self.open()  # writer has restarted
+        mm = self.mm
+        for _ in range(retries):
+            seq = SEQ.unpack_from(mm, SEQ_OFFSET)[0]
+            if not seq & 1:
+                t = TIME.unpack_from(mm, TIME_OFFSET)[0]
+                values = self.values.unpack_from(mm, self.values_offset)
+                if SEQ.unpack_from(mm, SEQ_OFFSET)[0] == seq:
+                    return seq, t, values
+            time.sleep(0)  # let the writer finish
+        raise TimeoutError(f"no consistent snapshot of {self.path}")
+
+    def read(self):
+        "consistent (seq, time, {name: value}), without missing values"
+        seq, t, values = self.snapshot()
+        return seq, t, {k: v for k, v in zip(self.fields, values) if not isnan(v)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,149 @@
+"""
+User defined derived quantities
+
+Quantities are configured as "NAME=expression;NAME=expression;..." where
+expressions use the course data fields (upper case names), other derived
+quantities, numbers, operators and the functions in FUNCTIONS plus the
+helpers passed in by the plugin (to360, to180, add_polar, ...), e.g.
+
+    VMG=STW*cos(radians(TWA)); AWDM=to360(AWD-VAR); DBSF=DBS/0.3048
+
+Results must be numbers, add_polar returns (angle, radius), so use
+add_polar(...)[0] or add_polar(...)[1].
+
+They are parsed and validated once, compiled into functions and sorted by
+their dependencies. Each cycle only calls the compiled functions.
+"""
+
+import ast
+import math
+import re
+
+NAME = re.compile(r"[A-Z][A-Z0-9_]*$")
+MAX_NAME = 16  # name length in the shared memory layout
+
+FUNCTIONS = {
+    k: getattr(math, k)
+    for k in (
+        "sin", "cos", "tan", "asin", "acos", "atan", "atan2", "radians",
+        "degrees", "sqrt", "exp", "log", "log10", "hypot", "floor", "ceil",
+    )
+}  # fmt: skip
+FUNCTIONS.update(abs=abs, min=min, max=max, round=round)
+
+NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp,
+    ast.Call, ast.Name, ast.Load, ast.Constant, ast.Tuple, ast.Subscript,
+    ast.operator, ast.unaryop, ast.boolop, ast.cmpop,
+)  # fmt: skip
+
+
+class Derived:
+    def __init__(self, text, helpers=None, fields=()):
+        """
+        text: "NAME=expression;..."
+        helpers: additional functions available in expressions
+        fields: reserved names of course data fields, cannot be redefined
+        """
+        self.functions = dict(FUNCTIONS, **(helpers or {}))
+        expressions = {}
+        for item in text.split(";"):
+            if not item.strip():
+                continue
+            name, sep, expression = item.partition("=")
+            name = name.strip()
+            if not sep or not NAME.match(name):
+                raise ValueError(f"invalid derived quantity {item.strip()!r}")
+            if len(name) > MAX_NAME:
+                raise ValueError(f"derived quantity {name} longer than {MAX_NAME} characters")
+            if name in fields or name in expressions:
+                raise ValueError(f"derived quantity {name} already defined")
+            expressions[name] = expression.strip()
+
+        compiled = {}
+        for name, expression in expressions.items():
+            compiled[name] = self.compile(name, expression)
+            if fields:
+                unknown = set(compiled[name][0]) - set(fields) - set(expressions)
+                if unknown:
+                    raise ValueError(f"derived quantity {name}: unknown {unknown}")
+
+        # compute plan: (name, dependencies, function) in dependency order
+        self.plan = []
+        done, visiting = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"circular dependency of derived quantity {name}")
+            visiting.add(name)
+            deps, function = compiled[name]
+            for d in deps:
+                if d in compiled:
+                    visit(d)
+            visiting.discard(name)
+            done.add(name)
+            self.plan.append((name, deps, function))
+
+        for name in compiled:
+            visit(name)
+
+        self.names = tuple(expressions)
+
+    def compile(self, name, expression):
+        "validate expression, return (fields used, function of data)"
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except SyntaxError as x:
+            raise ValueError(f"derived quantity {name}: {x.msg}")
+        deps = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, NODES):
+                raise ValueError(f"derived quantity {name}: {type(node).__name__} not allowed")
+            if isinstance(node, ast.Constant) and type(node.value) not in (int, float):
+                raise ValueError(f"derived quantity {name}: {node.value!r} not allowed")
+            if isinstance(node, ast.Call) and (
+                not isinstance(node.func, ast.Name)
+                or node.func.id not in self.functions
+                or node.keywords
+            ):
+                raise ValueError(f"derived quantity {name}: invalid call {ast.dump(node.func)}")
+            if isinstance(node, ast.Name):
+                if NAME.match(node.id):
+                    deps.add(node.id)
+                elif node.id not in self.functions:
+                    raise ValueError(f"derived quantity {name}: unknown name {node.id}")
+
+        # fields are looked up in the data passed as argument: X -> _data["X"]
+        class Fields(ast.NodeTransformer):
+            def visit_Name(self, node):
+                if NAME.match(node.id):
+                    data = ast.Name(id="_data", ctx=ast.Load())
+                    return ast.copy_location(
+                        ast.Subscript(value=data, slice=ast.Constant(node.id), ctx=ast.Load()),
+                        node,
+                    )
+                return node
+
+        body = Fields().visit(tree).body
+        args = ast.arguments(
+            posonlyargs=[], args=[ast.arg(arg="_data")], vararg=None,
+            kwonlyargs=[], kw_defaults=[], kwarg=None, defaults=[],
+        )  # fmt: skip
+        function = ast.Expression(body=ast.Lambda(args=args, body=body))
+        ast.fix_missing_locations(function)
+        code = compile(function, f"<derived {name}>", "eval")
+        return tuple(sorted(deps)), eval(code, {"__builtins__": {}, **self.functions})
+
+    def compute(self, data):
+        "add derived quantities to data (CourseData), skipped if inputs are missing or result is no number"
+        for name, deps, function in self.plan:
+            if all(d in data for d in deps):
+                try:
+                    v = function(data)
+                except (ArithmeticError, LookupError, TypeError, ValueError):
+                    continue
+                if isinstance(v, (int, float)):
+                    data[name] = v
+        return data
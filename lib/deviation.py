@@ -0,0 +1,103 @@
+"""
+Compass deviation card
+
+The deviation is given either as table of compass headings and deviations
+(from swinging the compass), which is interpolated linearly, or as the
+classic swing coefficients A,B,C,D,E
+
+    DEV = A + B sin(HDC) + C cos(HDC) + D sin(2 HDC) + E cos(2 HDC)
+
+Both are expanded once into a per-degree table, looking up the deviation
+is then O(1). Deviation is positive east, HDM = HDC + DEV.
+"""
+
+import re
+from math import sin, cos, radians
+
+# inline deviation in the config, anything else is a file name
+INLINE = re.compile(r"[-+0-9.eE:,\s]*$")
+
+
+class Deviation:
+    def __init__(self, table=None, coefficients=None):
+        "table: [(HDC,DEV),...], coefficients: (A,B,C,D,E)"
+        assert (table is None) != (coefficients is None)
+        if table is not None:
+            per_degree = self.expand_table(table)
+        else:
+            per_degree = self.expand_coefficients(*coefficients)
+        # one extra entry at 360 to interpolate without wrapping
+        self.table = tuple(per_degree + per_degree[:1])
+
+    @staticmethod
+    def expand_table(table):
+        points = sorted((h % 360, d) for h, d in table)
+        assert points, "empty deviation table"
+        # wrap around to interpolate across north
+        points = [(points[-1][0] - 360, points[-1][1])] + points
+        points += [(points[1][0] + 360, points[1][1])]
+        per_degree, j = [], 0
+        for h in range(360):
+            while points[j + 1][0] < h:
+                j += 1
+            (h0, d0), (h1, d1) = points[j], points[j + 1]
+            per_degree.append(d0 + (d1 - d0) * (h - h0) / (h1 - h0) if h1 > h0 else d0)
+        return per_degree
+
+    @staticmethod
+    def expand_coefficients(A, B=0, C=0, D=0, E=0):
+        return [
+            A + B * sin(radians(h)) + C * cos(radians(h))
+            + D * sin(radians(2 * h)) + E * cos(radians(2 * h))
+            for h in range(360)
+        ]
+
+    @classmethod
+    def from_setting(cls, value, path=str):
+        """
+        from the config setting, inline text if it consists of numbers and
+        separators only, otherwise a file name, path(name) gives the file
+        """
+        if INLINE.match(value):
+            return cls.parse(value)
+        return cls.load(path(value))
+
+    @classmethod
+    def parse(cls, text):
+        "HDC:DEV,HDC:DEV,... -> table, A,B,C,D,E -> coefficients"
+        items = [i.strip() for i in text.split(",") if i.strip()]
+        try:
+            if items and all(":" in i for i in items):
+                table = [tuple(map(float, i.split(":"))) for i in items]
+                if any(len(t) != 2 for t in table):
+                    raise ValueError
+                return cls(table=table)
+            if 0 < len(items) <= 5:
+                return cls(coefficients=[float(i) for i in items])
+        except ValueError:
+            pass
+        raise ValueError(f"invalid deviation {text!r}, expected HDC:DEV,... or A,B,C,D,E")
+
+    @classmethod
+    def load(cls, filename):
+        "from file with lines HDC DEV"
+        with open(filename) as f:
+            lines = [l.split("#")[0].strip() for l in f]
+        return cls.parse(",".join(re.sub(r"[\s:;,]+", ":", l) for l in lines if l))
+
+    def __call__(self, hdc):
+        "deviation for compass heading"
+        h = hdc % 360
+        if h >= 360:  # -1e-20 % 360
+            h = 0.0
+        i = int(h)
+        t = self.table
+        return t[i] + (h - i) * (t[i + 1] - t[i])
+
+    def hdm(self, hdc):
+        "magnetic heading for compass heading"
+        return (hdc + self(hdc)) % 360
+
+    def batch(self, headings):
+        "magnetic headings for a sequence of compass headings (log replay)"
+        return [self.hdm(h) for h in headings]
@@ -0,0 +1,145 @@
+"""
+Boat polar and performance targets
+
+Reads a polar table TWA x TWS -> BSP in the common .pol/.csv format
+
+    TWA\\TWS  6    8    10   ...
+    52       5.1  6.0  6.6  ...
+    60       5.4  6.4  6.9  ...
+    ...
+
+(separated by tabs, spaces, ';' or ','), speeds usually in knots. The table
+is resampled once onto a dense grid (1 deg x 0.5 kn) and the optimal upwind
+and downwind angles are precomputed for every TWS of the grid, so all lookups
+are O(1) bilinear or linear interpolations.
+
+Targets, all speeds in the unit of the caller (unit = caller unit -> file unit):
+
+TBS = target boat speed from polar at TWA/TWS
+PPC = polar percentage, STW/TBS*100
+TUA = target upwind TWA (optimal VMG)
+TUV = target upwind VMG
+TDA = target downwind TWA (optimal VMG)
+TDV = target downwind VMG
+"""
+
+import bisect
+import re
+from math import cos, radians
+
+
+class Polar:
+    def __init__(self, twa, tws, bsp, unit=1.0, twa_step=1.0, tws_step=0.5):
+        "twa: angles of rows, tws: speeds of columns, bsp[row][column], in file units"
+        twa, tws = list(twa), list(tws)
+        bsp = [list(r) for r in bsp]
+        if not twa or not tws:
+            raise ValueError("polar has no TWA or TWS values")
+        if len(bsp) != len(twa) or any(len(r) != len(tws) for r in bsp):
+            raise ValueError("polar rows do not match TWA/TWS values")
+        for name, values in (("TWA", twa), ("TWS", tws)):
+            if any(a >= b for a, b in zip(values, values[1:])):
+                raise ValueError(f"{name} values of polar must be increasing without duplicates")
+        # boat does not move without wind or head to wind
+        if tws[0] > 0:
+            tws.insert(0, 0.0)
+            bsp = [[0.0] + r for r in bsp]
+        if twa[0] > 0:
+            twa.insert(0, 0.0)
+            bsp.insert(0, [0.0] * len(tws))
+        if twa[-1] < 180:
+            twa.append(180.0)
+            bsp.append(list(bsp[-1]))
+
+        self.unit = unit
+        self.twa_step = twa_step
+        self.tws_step = tws_step
+        self.ntwa = int(round(180 / twa_step)) + 1
+        self.ntws = int(tws[-1] / tws_step) + 2
+
+        def interpolate(x, xs):
+            i = min(max(bisect.bisect_right(xs, x) - 1, 0), len(xs) - 2)
+            return i, min(max((x - xs[i]) / (xs[i + 1] - xs[i]), 0.0), 1.0)
+
+        grid = []
+        for i in range(self.ntwa):
+            a, fa = interpolate(i * twa_step, twa)
+            row = []
+            for j in range(self.ntws):
+                s, fs = interpolate(j * tws_step, tws)
+                b0 = bsp[a][s] + fs * (bsp[a][s + 1] - bsp[a][s])
+                b1 = bsp[a + 1][s] + fs * (bsp[a + 1][s + 1] - bsp[a + 1][s])
+                row.append(b0 + fa * (b1 - b0))
+            grid.append(tuple(row))
+        self.grid = tuple(grid)
+
+        # optimal VMG angles per TWS of the grid: (TUA, TUV, TDA, TDV)
+        # columns without boat speed (no wind) have no optimum, they get that of
+        # the first column with boat speed, otherwise angles are nonsense at low wind
+        first = next((j for j in range(self.ntws) if any(r[j] > 0 for r in self.grid)), None)
+        if first is None:
+            raise ValueError("polar has no boat speeds")
+        optimal = []
+        for j in range(self.ntws):
+            column = max(j, first)
+            vmg = [
+                (self.grid[i][column] * cos(radians(i * twa_step)), i * twa_step)
+                for i in range(self.ntwa)
+            ]
+            up = max(vmg)
+            down = min(vmg)
+            optimal.append((up[1], up[0], down[1], -down[0]))
+        self.optimal = tuple(optimal)
+
+    @classmethod
+    def load(cls, filename, unit=1.0):
+        "from file, unit converts the speeds of the caller to those of the file"
+        rows = []
+        with open(filename) as f:
+            for line in f:
+                line = line.split("#")[0].strip()
+                if line:
+                    rows.append(re.split(r"[\s;,]+", line))
+        if len(rows) < 2:
+            raise ValueError(f"polar file {filename} has no data")
+        tws = [float(v) for v in rows[0][1:]]
+        twa = [float(r[0]) for r in rows[1:]]
+        bsp = [[float(v) for v in r[1:]] for r in rows[1:]]
+        return cls(twa, tws, bsp, unit)
+
+    def index(self, tws):
+        "grid column and fraction for TWS"
+        y = min(max(tws * self.unit / self.tws_step, 0.0), self.ntws - 1.0)
+        j = min(int(y), self.ntws - 2)
+        return j, y - j
+
+    def speed(self, twa, tws):
+        "target boat speed"
+        x = abs((twa + 180) % 360 - 180) / self.twa_step
+        i = min(int(x), self.ntwa - 2)
+        fx = x - i
+        j, fy = self.index(tws)
+        g0, g1 = self.grid[i], self.grid[i + 1]
+        b0 = g0[j] + fy * (g0[j + 1] - g0[j])
+        b1 = g1[j] + fy * (g1[j + 1] - g1[j])
+        return (b0 + fx * (b1 - b0)) / self.unit
+
+    def vmg_targets(self, tws):
+        "(TUA, TUV, TDA, TDV)"
+        j, f = self.index(tws)
+        o0, o1 = self.optimal[j], self.optimal[j + 1]
+        a, v, b, w = (x0 + f * (x1 - x0) for x0, x1 in zip(o0, o1))
+        return a, v / self.unit, b, w / self.unit
+
+    def targets(self, twa, tws, stw=None):
+        "dict of targets, PPC only if STW is given"
+        t = dict(zip(("TUA", "TUV", "TDA", "TDV"), self.vmg_targets(tws)))
+        t["TBS"] = self.speed(twa, tws)
+        if stw is not None and t["TBS"] > 0:
+            t["PPC"] = 100 * stw / t["TBS"]
+        return t
+
+    def batch(self, twa, tws, stw=None):
+        "targets for sequences of TWA, TWS (and STW), e.g. from a log"
+        stw = stw if stw is not None else [None] * len(twa)
+        return [self.targets(a, s, b) for a, s, b in zip(twa, tws, stw)]
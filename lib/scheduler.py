@@ -0,0 +1,32 @@
+"""
+Adaptive compute period for the plugin main loop
+"""
+
+
+class AdaptivePeriod:
+    """
+    Compute period that backs off while the boat is idle.
+
+    Idle means no input has been updated since the last cycle or the boat is
+    stationary (SOG and STW below idle_speed). While idle the period is doubled
+    every cycle up to period_max, it snaps back to period as soon as the boat
+    moves again or fresh data appears after a period without any.
+    """
+
+    def __init__(self, period, period_max, idle_speed):
+        self.period = period
+        self.period_max = max(period, period_max)
+        self.idle_speed = idle_speed
+        self.current = period
+        self.was_fresh = True
+
+    def update(self, fresh, *speeds):
+        "period until next cycle, speeds may contain None"
+        speeds = [abs(s) for s in speeds if s is not None]
+        stationary = bool(speeds) and max(speeds) < self.idle_speed
+        if fresh and (not stationary or not self.was_fresh):
+            self.current = self.period
+        else:
+            self.current = min(2 * self.current, self.period_max)
+        self.was_fresh = fresh
+        return self.current
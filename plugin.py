@@ -6,10 +6,12 @@
 # https://www.nmea.org/Assets/100108_nmea_0183_sentences_not_recommended_for_new_designs.pdf
 # http://www.plaisance-pratique.com/IMG/pdf/NMEA0183-2.pdf
 
+import importlib.util
 import os
 import re
 import sys
 import time
+from datetime import date, datetime
 from math import isfinite, sin, cos, radians, degrees, sqrt, atan2
 
 from avnav_nmea import NMEAParser
@@ -24,6 +26,28 @@ try:
 except:
     pass
 
+
+def plugin_module(filename):
+    """
+    module of the plugin by file name, under a unique name so it does not
+    clash with modules of the same name of other plugins in the AvNav process
+    """
+    name = "calculated_data_" + os.path.splitext(os.path.basename(filename))[0]
+    if name not in sys.modules:
+        path = os.path.join(os.path.dirname(__file__), filename)
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+Deviation = plugin_module("lib/deviation.py").Deviation
+Derived = plugin_module("lib/derived.py").Derived
+Polar = plugin_module("lib/polar.py").Polar
+AdaptivePeriod = plugin_module("lib/scheduler.py").AdaptivePeriod
+Publisher = plugin_module("calculated_shm.py").Publisher
+
 VERSION = 20240226
 SOURCE = "calculated-data"
 KNOTS = 1.94384  # knots per m/s
@@ -35,6 +59,8 @@ INPUT_FIELDS = {
     "SOG": "gps.speed",
     "HDT": "gps.headingTrue",
     "HDM": "gps.headingMag",
+    "HDC": "gps.headingCompass",
+    "DEV": "gps.magDeviation",
     "STW": "gps.waterSpeed",
     "SET": "gps.currentSet",
     "DFT": "gps.currentDrift",
@@ -65,17 +91,34 @@ NMEA_SENTENCES = {
     "DBT": "${ID}DBT,,,{data.DBT:.1f},M,,",  # depth below transducer
     "DBK": "${ID}DBK,,,{data.DBK:.1f},M,,",  # depth below keel
 }
+# compiled once, evaluated every cycle
+NMEA_CODE = {k: compile(f"f'{s}'", k, "eval") for k, s in NMEA_SENTENCES.items()}
+
+# all fields of CourseData
+DATA_FIELDS = sorted(
+    set(INPUT_FIELDS)
+    | {"CRS", "AWD", "LEF", "DOT", "DRT"}
+    | {"TBS", "PPC", "TUA", "TUV", "TDA", "TDV"}
+)
 
 PATH_PREFIX = "gps.calculated."
 PERIOD = "period"
+PERIOD_MAX = "period_max"
+IDLE_SPEED = "idle_speed"
 WMM_FILE = "wmm_file"
 WMM_PERIOD = "wmm_period"
+# old default saved by every installation, migrated to selection by date
+WMM_AUTO = ("", "WMM2020.COF")
 WRITE = "nmea_write"
 NMEA_FILTER = "nmea_filter"
 PRIORITY = "nmea_priority"
 TALKER_ID = "nmea_id"
 DEPTH_OF_TRANSDUCER = "depth_transducer"
 DRAUGHT = "draught"
+DEVIATION = "deviation"
+SHM_NAME = "shm_name"
+DERIVED = "derived"
+POLAR_FILE = "polar_file"
 CONFIG = [
     {
         "name": PERIOD,
@@ -83,10 +126,22 @@ CONFIG = [
         "type": "FLOAT",
         "default": 1,
     },
+    {
+        "name": PERIOD_MAX,
+        "description": "max compute period (s) when idle (stationary or no fresh input), period is doubled while idle (<=period disables), keep it well below the data expiry of AvNav (30s by default), otherwise calculated values expire between cycles",
+        "type": "FLOAT",
+        "default": 10,
+    },
+    {
+        "name": IDLE_SPEED,
+        "description": "speed (m/s) of SOG/STW below which the boat is stationary",
+        "type": "FLOAT",
+        "default": 0.3,
+    },
     {
         "name": WMM_FILE,
-        "description": "file with WMM-coefficents for magnetic deviation",
-        "default": "WMM2020.COF",
+        "description": "file with WMM-coefficents for magnetic deviation (empty=select model by date from all files in lib)",
+        "default": "",
     },
     {
         "name": WMM_PERIOD,
@@ -106,6 +161,21 @@ CONFIG = [
         "type": "FLOAT",
         "default": -1,
     },
+    {
+        "name": DEVIATION,
+        "description": "compass deviation, table HDC:DEV,... or coefficients A,B,C,D,E or file with lines HDC DEV (empty=disabled)",
+        "default": "",
+    },
+    {
+        "name": POLAR_FILE,
+        "description": "file with boat polar TWA x TWS -> BSP in knots for performance targets (empty=disabled)",
+        "default": "",
+    },
+    {
+        "name": DERIVED,
+        "description": "derived quantities NAME=expression;... over the calculated values, e.g. VMG=STW*cos(radians(TWA));AWDM=to360(AWD-VAR)",
+        "default": "",
+    },
     {
         "name": WRITE,
         "description": "write NMEA sentences (sent to outputs and parsed by AvNav)",
@@ -117,6 +187,11 @@ CONFIG = [
         "description": "filter for NMEA sentences to be sent",
         "default": "",
     },
+    {
+        "name": SHM_NAME,
+        "description": "publish values to shared memory /dev/shm/<name>, read with calculated_shm.Reader (empty=disabled)",
+        "default": "",
+    },
     {
         "name": PRIORITY,
         "description": "NMEA source priority",
@@ -151,10 +226,17 @@ class Plugin(object):
         self.api.registerEditableParameters(CONFIG, self.changeParam)
         self.api.registerRestart(self.stop)
         self.variation_model = None
+        self.publisher = None
+        self.input_time = 0
         self.saveAllConfig()
 
     def stop(self):
-        pass
+        self.close_publisher()
+
+    def close_publisher(self):
+        if self.publisher:
+            self.publisher.close()
+            self.publisher = None
 
     def getConfigValue(self, name):
         defaults = self.pluginInfo()["config"]
@@ -179,10 +261,31 @@ class Plugin(object):
         self.api.saveConfigValues(param)
         self.config_changed = True
 
+    def load_config(self, name, load):
+        "load(value) of a config value, None if empty or invalid (error is logged and shown in status)"
+        value = self.getConfigValue(name)
+        if not value.strip():
+            return None
+        try:
+            return load(value)
+        except Exception as x:
+            self.api.log(f"{name} error {x}")
+            self.config_errors[name] = str(x)
+
+    def plugin_file(self, filename):
+        "file names without directory are relative to the plugin directory"
+        if "/" not in filename:
+            filename = os.path.join(os.path.dirname(__file__), filename)
+        return filename
+
     def readValue(self, path):
         "prevents reading values that we self have calculated"
         a = self.api.getSingleValue(path, includeInfo=True)
         if a is not None and SOURCE not in a.source:
+            # values without timestamp cannot tell if they are fresh
+            t = getattr(a, "timestamp", None)
+            if t:
+                self.input_time = max(self.input_time, t)
             return a.value
 
     def writeValue(self, data, key, path):
@@ -200,26 +303,59 @@ class Plugin(object):
                 assert self.variation_period > 0
                 self.variation_time = 0
                 filename = self.getConfigValue(WMM_FILE)
-                if "/" not in filename:
-                    filename = os.path.join(
-                        os.path.dirname(__file__) + "/lib", filename
+                if filename in WMM_AUTO:
+                    self.variation_model = geomag.get_registry(
+                        os.path.dirname(__file__) + "/lib"
                     )
-                self.variation_model = geomag.GeoMag(filename)
+                else:
+                    if "/" not in filename:
+                        filename = os.path.join(
+                            os.path.dirname(__file__) + "/lib", filename
+                        )
+                    self.variation_model = geomag.GeoMag(filename)
             except Exception as x:
                 self.api.log(f"WMM error {x}")
                 return
         if time.monotonic() - self.variation_time > self.variation_period:
-            self.variation = self.variation_model.GeoMag(lat, lon).dec
+            self.variation = self.variation_model.GeoMag(
+                lat, lon, time=self.data_date()
+            ).dec
             self.variation_time = time.monotonic()
         return self.variation
 
+    def data_date(self):
+        "date of the data from gps.time (for replayed logs), today if not available"
+        t = self.readValue("gps.time")
+        if t is not None:
+            try:
+                if isinstance(t, str):
+                    t = datetime.fromisoformat(t.replace("Z", "+00:00"))
+                if isinstance(t, datetime):
+                    return t.date()
+            except ValueError:
+                pass
+        return date.today()
+
     def run(self):
+        try:
+            self.compute_loop()
+        finally:
+            # also if the loop crashed, readers see the segment is gone
+            self.close_publisher()
+
+    def compute_loop(self):
         self.config_changed = True
         while not self.api.shouldStopMainThread():
             if self.config_changed:
+                self.config_errors = {}
                 self.variation_model = None
                 period = float(self.getConfigValue(PERIOD))
                 assert period > 0
+                scheduler = AdaptivePeriod(
+                    period,
+                    float(self.getConfigValue(PERIOD_MAX)),
+                    float(self.getConfigValue(IDLE_SPEED)),
+                )
                 nmea_write = self.getConfigValue(WRITE).startswith("T")
                 nmea_filter = self.getConfigValue(NMEA_FILTER).split(",")
                 nmea_priority = int(self.getConfigValue(PRIORITY))
@@ -228,29 +364,65 @@ class Plugin(object):
                 draught = float(self.getConfigValue(DRAUGHT))
                 ID = self.getConfigValue(TALKER_ID)
                 assert len(ID) == 2
+                deviation = self.load_config(
+                    DEVIATION, lambda v: Deviation.from_setting(v, self.plugin_file)
+                )
+                polar = self.load_config(
+                    POLAR_FILE, lambda v: Polar.load(self.plugin_file(v), KNOTS)
+                )
+                derived = self.load_config(
+                    DERIVED,
+                    lambda v: Derived(
+                        v,
+                        dict(to360=to360, to180=to180, add_polar=add_polar),
+                        DATA_FIELDS,
+                    ),
+                )
+                self.close_publisher()
+                self.publisher = self.load_config(
+                    SHM_NAME,
+                    lambda v: Publisher(
+                        v, DATA_FIELDS + list(derived.names if derived else ())
+                    ),
+                )
                 self.config_changed = False
 
+            input_time = self.input_time
             data = {k: self.readValue(p) for k, p in INPUT_FIELDS.items()}
             present = {k for k in data.keys() if data[k] is not None}
+            current_period = scheduler.update(
+                self.input_time > input_time, data["SOG"], data["STW"]
+            )
 
             if all(data.get(k) is not None for k in ("LAT", "LON")):
                 data["VAR"] = self.mag_variation(data["LAT"], data["LON"])
 
+            if deviation and data.get("DEV") is None and data.get("HDC") is not None:
+                data["DEV"] = deviation(data["HDC"])
+
             data["DOT"] = dot if dot >= 0 else None
             data["DRT"] = draught if draught >= 0 else None
 
             data = CourseData(**data)
+            if polar and data.has("TWA", "TWS"):
+                for k, v in polar.targets(data.TWA, data.TWS, data.STW).items():
+                    data[k] = v
+            if derived:
+                derived.compute(data)
             calculated = {k for k in data.keys() if data[k] is not None}
             calculated -= present
 
             for k in data.keys():
                 self.writeValue(data, k, PATH_PREFIX + k)
 
+            if self.publisher:
+                self.publisher.publish(data)
+
             sending = set()
             if nmea_write:
-                for f, s in NMEA_SENTENCES.items():
+                for f, c in NMEA_CODE.items():
                     if all(k in calculated for k in f.split(",")):
-                        s = eval(f"f'{s}'")
+                        s = eval(c)
                         if not nmea_filter or NMEAParser.checkFilter(s, nmea_filter):
                             self.api.addNMEA(
                                 s,
@@ -260,8 +432,18 @@ class Plugin(object):
                             )
                             sending.add(s[:6])
 
-            self.api.setStatus("NMEA", f"{present} --> {calculated} sending {sending}")
-            time.sleep(period)
+            self.api.setStatus(
+                "NMEA",
+                f"{present} --> {calculated} sending {sending} period {current_period:g}s"
+                + (f" config errors {self.config_errors}" if self.config_errors else ""),
+            )
+
+            wake = time.monotonic() + current_period
+            while not (self.config_changed or self.api.shouldStopMainThread()):
+                remaining = wake - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(min(remaining, max(period, 1)))
 
 
 class CourseData:
@@ -306,6 +488,12 @@ class CourseData:
     DBK = depth below keel
     DRT = draught
     DOT = depth of transducer
+    TBS = target boat speed from polar at TWA/TWS
+    PPC = polar percentage, STW/TBS*100
+    TUA = target upwind TWA, optimal VMG from polar
+    TUV = target upwind VMG
+    TDA = target downwind TWA, optimal VMG from polar
+    TDV = target downwind VMG
 
     Beware! Wind direction is the direction where the wind is coming FROM, SET,HDG,COG is the direction where the tide/boat is going TO.
 
@@ -475,9 +663,8 @@ class CourseData:
 
 def to360(a):
     "limit a to [0,360)"
-    while a < 0:
-        a += 360
-    return a % 360
+    a %= 360
+    return 0.0 if a == 360 else a  # -1e-20 % 360
 
 
 def to180(a):
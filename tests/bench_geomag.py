@@ -0,0 +1,67 @@
+"""
+throughput of lib/geomag.py in points/second over the grid of test_geomag.py
+
+    python tests/bench_geomag.py [seconds per path]
+
+Each path is checked against the reference values of the models it
+evaluates before it is timed, so a faster path that is wrong fails here, too.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from test_geomag import LIB, MODELS, WMM_FILE, cof, geomag, grid, read_reference
+
+
+def scalar():
+    gm = geomag.GeoMag(WMM_FILE)
+    return lambda points: [gm.GeoMag(lat, lon, h, d) for d, h, lat, lon in points]
+
+
+def registry():
+    gm = geomag.get_registry(LIB)
+    return lambda points: [gm.GeoMag(lat, lon, h, d) for d, h, lat, lon in points]
+
+
+PATHS = {
+    "scalar": scalar,
+    "registry": registry,
+}
+
+
+def check(name, f):
+    "points evaluated with the model of a reference must match it"
+    n = 0
+    for model in MODELS:
+        ref = list(read_reference(model))
+        results = f([(d, h, lat, lon) for d, h, lat, lon, *_ in ref])
+        expected = geomag.GeoMag(cof(model)).model
+        for r, m in zip(ref, results):
+            if m.model == expected:
+                assert abs(r[4] - m.dec) < 1e-6, f"{name}: {r[:4]} dec={m.dec} expected {r[4]}"
+                n += 1
+    assert n, f"{name}: no reference values"
+
+
+def bench(f, seconds):
+    points = [p for model in MODELS for p in grid(model)]
+    n, t0 = 0, time.perf_counter()
+    while True:
+        f(points)
+        n += len(points)
+        t = time.perf_counter() - t0
+        if t >= seconds:
+            return n / t
+
+
+def main(seconds=2.0):
+    for name, make in PATHS.items():
+        f = make()
+        check(name, f)
+        print(f"{name:10s} {bench(f, seconds):10.0f} points/s")
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
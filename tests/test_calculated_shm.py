@@ -0,0 +1,91 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from calculated_shm import Publisher, Reader
+
+
+class Data(dict):
+    def __getitem__(self, item):
+        return self.get(item)
+
+
+class SharedMemoryTest(unittest.TestCase):
+    def setUp(self):
+        self.name = os.path.join(tempfile.mkdtemp(), "calculated")
+
+    def tearDown(self):
+        os.rmdir(os.path.dirname(self.name))
+
+    def test_roundtrip(self):
+        p = Publisher(self.name, ["AWA", "TWA", "TWS"])
+        with Reader(self.name) as r:
+            seq, t, data = r.read()
+            self.assertEqual((seq, data), (0, {}))
+            p.publish(Data(TWA=-45.5, TWS=6, AWA=(1, 2), XYZ=1), t=123.0)
+            self.assertEqual(r.read(), (2, 123.0, {"TWA": -45.5, "TWS": 6.0}))
+            self.assertEqual(r.fields, ("AWA", "TWA", "TWS"))
+        p.close()
+        self.assertFalse(os.path.exists(self.name))
+
+    def test_restart(self):
+        p = Publisher(self.name, ["TWA"])
+        r = Reader(self.name)
+        p.publish(Data(TWA=1))
+        self.assertEqual(r.read()[2], {"TWA": 1})
+        p.close()
+        p = Publisher(self.name, ["TWA", "TWS"])
+        p.publish(Data(TWS=2))
+        self.assertEqual(r.read()[2], {"TWS": 2})
+        r.close()
+        p.close()
+
+    def test_crash(self):
+        "writer restarted without closing the old segment"
+        p = Publisher(self.name, ["TWA"])
+        r = Reader(self.name)
+        p.publish(Data(TWA=1))
+        self.assertEqual(r.read()[2], {"TWA": 1})
+        q = Publisher(self.name, ["TWA", "TWS"])
+        q.publish(Data(TWS=2))
+        self.assertEqual(r.read()[2], {"TWS": 2})
+        r.close()
+        p.mm.close()
+        q.close()
+
+    def test_invalid(self):
+        with open(self.name, "wb") as f:
+            f.write(bytes(64))
+        with self.assertRaises(ValueError):
+            Reader(self.name).read()
+        os.unlink(self.name)
+
+    def test_consistent(self):
+        fields = [f"F{i}" for i in range(50)]
+        p = Publisher(self.name, fields)
+        done = threading.Event()
+
+        def writer():
+            i = 0
+            while not done.is_set():
+                i += 1
+                p.publish(Data((k, i) for k in fields))
+
+        w = threading.Thread(target=writer)
+        w.start()
+        try:
+            with Reader(self.name) as r:
+                for _ in range(2000):
+                    seq, t, values = r.snapshot()
+                    self.assertEqual(len(set(values)), 1)
+        finally:
+            done.set()
+            w.join()
+            p.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import unittest
+from math import cos, radians, nan
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib"))
+from derived import Derived
+
+FIELDS = ("STW", "TWA", "AWD", "VAR", "DBS")
+
+
+class Data(dict):
+    "minimal stand-in for CourseData: missing and NaN values are not contained"
+
+    def __contains__(self, item):
+        v = self.get(item)
+        return v is not None and v == v
+
+
+class DerivedTest(unittest.TestCase):
+    def test_compute(self):
+        d = Derived(
+            "VMGK=VMG*1.94384; VMG=STW*cos(radians(TWA)); AWDM=wrap(AWD-VAR);",
+            dict(wrap=lambda a: a % 360),
+            FIELDS,
+        )
+        self.assertEqual(d.names, ("VMGK", "VMG", "AWDM"))
+        self.assertEqual([p[0] for p in d.plan], ["VMG", "VMGK", "AWDM"])
+        data = d.compute(Data(STW=5, TWA=-45, AWD=10, VAR=20))
+        self.assertAlmostEqual(data["VMG"], 5 * cos(radians(45)))
+        self.assertAlmostEqual(data["VMGK"], data["VMG"] * 1.94384)
+        self.assertEqual(data["AWDM"], 350)
+
+    def test_missing(self):
+        d = Derived("DBSF=DBS/0.3048; INV=1/DBS", fields=FIELDS)
+        self.assertNotIn("DBSF", d.compute(Data(DBS=nan)))
+        self.assertNotIn("DBSF", d.compute(Data(STW=1)))
+        data = d.compute(Data(DBS=0))
+        self.assertEqual(data["DBSF"], 0)
+        self.assertNotIn("INV", data)
+
+    def test_scalar(self):
+        d = Derived(
+            "W=polar((TWA,STW),(0,1)); WA=polar((TWA,STW),(0,1))[0]",
+            dict(polar=lambda a, b: (a[0] + b[0], a[1] + b[1])),
+            FIELDS,
+        )
+        data = d.compute(Data(STW=5, TWA=-45))
+        self.assertNotIn("W", data)
+        self.assertEqual(data["WA"], -45)
+        d = Derived("X=polar((TWA,STW),(0,1))[2]", dict(polar=lambda a, b: a), FIELDS)
+        self.assertNotIn("X", d.compute(Data(STW=5, TWA=-45)))
+
+    def test_invalid(self):
+        for text in (
+            "vmg=STW",
+            "VMG",
+            "VMG=STW*",
+            "VMG=__import__('os')",
+            "VMG=STW.real",
+            "VMG=open(STW)",
+            "VMG=[STW]",
+            "VMG='x'",
+            "VMG=XYZ",
+            "STW=TWA",
+            "A=B;B=A",
+            "A=1;A=2",
+            "A23456789ABCDEFGH=1",
+        ):
+            with self.assertRaises(ValueError, msg=text):
+                Derived(text, fields=FIELDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
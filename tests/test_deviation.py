@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+import unittest
+from math import sin, cos, radians
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib"))
+from deviation import Deviation
+
+
+class DeviationTest(unittest.TestCase):
+    def test_table(self):
+        d = Deviation.parse("0:2, 90:-2, 180:2, 270:-2")
+        self.assertAlmostEqual(d(0), 2)
+        self.assertAlmostEqual(d(45), 0)
+        self.assertAlmostEqual(d(90), -2)
+        self.assertAlmostEqual(d(315), 0)
+        self.assertAlmostEqual(d(359.5), 2 - 2 / 90, 6)
+        self.assertAlmostEqual(d(-90), -2)
+        self.assertAlmostEqual(d(-1e-20), 2)
+        self.assertAlmostEqual(d.hdm(359), 1 - 2 / 45)
+
+    def test_coefficients(self):
+        d = Deviation.parse("0.5,1,-2,0.3,0.1")
+        for h in (0, 17.5, 123, 359.9):
+            r = radians(h)
+            dev = 0.5 + sin(r) - 2 * cos(r) + 0.3 * sin(2 * r) + 0.1 * cos(2 * r)
+            self.assertAlmostEqual(d(h), dev, 3)
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "deviation.txt"), "w") as f:
+                f.write("# HDC DEV\n0 1\n180 -1\n")
+            with open(os.path.join(directory, "3"), "w") as f:
+                f.write("0 5\n")
+            path = lambda f: os.path.join(directory, f)
+            d = Deviation.from_setting("deviation.txt", path)
+            self.assertAlmostEqual(d(90), 0)
+            self.assertAlmostEqual(d(270), 0)
+            # numbers are inline text, even if a file with that name exists
+            self.assertAlmostEqual(Deviation.from_setting("3", path)(90), 3)
+            with self.assertRaises(OSError):
+                Deviation.from_setting("missing.txt", path)
+
+    def test_batch(self):
+        d = Deviation.parse("3")
+        self.assertEqual(d.batch([0, 90, 358]), [3, 93, 1])
+
+    def test_invalid(self):
+        for text in ("1,2,3,4,5,6", "0:2,abc", "0:1:2", "", "0:2,1"):
+            with self.assertRaises(ValueError, msg=text):
+                Deviation.parse(text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+"""
+tests for lib/geomag.py
+
+Checks the shipped models against the official NOAA test values
+(WMM2020_TEST_VALUES.txt, WMM2025_TEST_VALUES.txt), and dec/dip/ti of
+each model over a global lat/lon/alt/date grid against reference values
+in geomag_reference_<model>.csv, which were computed with the original
+scalar implementation of geomag.py. Any optimized path has to reproduce
+them.
+
+    python -m pytest tests
+    python tests/test_geomag.py --write-reference WMM2030  # only for a new model
+"""
+
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import date
+
+LIB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib")
+sys.path.insert(0, LIB)
+import geomag
+
+WMM_FILE = os.path.join(LIB, "WMM2020.COF")
+REFERENCE = os.path.join(os.path.dirname(__file__), "geomag_reference_{}.csv")
+
+# dates of the grid per model, within the 5 years of its epoch
+MODELS = {
+    "WMM2020": (date(2020, 1, 1), date(2022, 7, 2), date(2024, 12, 31)),
+    "WMM2025": (date(2025, 1, 1), date(2027, 7, 2), date(2029, 12, 31)),
+}
+ALTS = (0, 328083.99)  # feet, 0 and 100km
+LATS = (-89,) + tuple(range(-80, 81, 10)) + (89,)
+LONS = tuple(range(-180, 181, 30))
+
+# tolerances, degrees and nT
+DEC_TOL = DIP_TOL = 1e-6
+TI_TOL = 1e-3
+
+
+def cof(model):
+    return os.path.join(LIB, model + ".COF")
+
+
+def grid(model):
+    for d in MODELS[model]:
+        for h in ALTS:
+            for lat in LATS:
+                for lon in LONS:
+                    yield d, h, lat, lon
+
+
+def read_reference(model):
+    with open(REFERENCE.format(model)) as f:
+        for r in csv.DictReader(f):
+            yield (
+                date.fromisoformat(r["date"]),
+                float(r["alt"]),
+                float(r["lat"]),
+                float(r["lon"]),
+                float(r["dec"]),
+                float(r["dip"]),
+                float(r["ti"]),
+            )
+
+
+def write_reference(model):
+    gm = geomag.GeoMag(cof(model))
+    with open(REFERENCE.format(model), "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(("date", "alt", "lat", "lon", "dec", "dip", "ti"))
+        for d, h, lat, lon in grid(model):
+            m = gm.GeoMag(lat, lon, h, d)
+            w.writerow((d.isoformat(), h, lat, lon, repr(m.dec), repr(m.dip), repr(m.ti)))
+
+
+def read_noaa(filename, columns):
+    "official test values: (date, alt (feet), lat, lon, dec, dip, ti)"
+    with open(os.path.join(os.path.dirname(__file__), filename)) as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                r = dict(zip(columns, map(float, line.split())))
+                yield r["date"], r["alt"] * 3280.8399, r["lat"], r["lon"], r["D"], r["I"], r["F"]
+
+
+NOAA = {
+    "WMM2020": ("WMM2020_TEST_VALUES.txt", ("date", "alt", "lat", "lon", "D", "I", "H", "X", "Y", "Z", "F")),
+    "WMM2025": ("WMM2025_TEST_VALUES.txt", ("date", "alt", "lat", "lon", "X", "Y", "Z", "H", "F", "I", "D")),
+}
+
+# official values are rounded to 0.01 deg and 0.1 nT
+NOAA_ANGLE_TOL = 0.006
+NOAA_TI_TOL = 0.06
+
+
+class GeoMagNOAATest(unittest.TestCase):
+    def check(self, model):
+        gm = geomag.GeoMag(cof(model))
+        n = 0
+        for d, h, lat, lon, dec, dip, ti in read_noaa(*NOAA[model]):
+            m = gm.GeoMag(lat, lon, h, d)
+            where = f"{model} {d} alt={h} lat={lat} lon={lon}"
+            self.assertAlmostEqual(dec, m.dec, delta=NOAA_ANGLE_TOL, msg=where)
+            self.assertAlmostEqual(dip, m.dip, delta=NOAA_ANGLE_TOL, msg=where)
+            self.assertAlmostEqual(ti, m.ti, delta=NOAA_TI_TOL, msg=where)
+            n += 1
+        self.assertGreater(n, 0)
+
+    def test_wmm2020(self):
+        self.check("WMM2020")
+
+    def test_wmm2025(self):
+        self.check("WMM2025")
+
+    def test_legacy(self):
+        "GeoMagTest in geomag.py, not collected by pytest from lib"
+        suite = unittest.defaultTestLoader.loadTestsFromTestCase(geomag.GeoMagTest)
+        with open(os.devnull, "w") as devnull:
+            result = unittest.TextTestRunner(stream=devnull).run(suite)
+        self.assertTrue(result.wasSuccessful())
+
+
+class GeoMagGridTest(unittest.TestCase):
+    def check(self, gm, model):
+        "number of points gm evaluated with model"
+        name = geomag.GeoMag(cof(model)).model
+        n = 0
+        for d, h, lat, lon, dec, dip, ti in read_reference(model):
+            m = gm.GeoMag(lat, lon, h, d)
+            if m.model != name:
+                continue
+            where = f"{model} {d} alt={h} lat={lat} lon={lon}"
+            self.assertAlmostEqual(dec, m.dec, delta=DEC_TOL, msg=where)
+            self.assertAlmostEqual(dip, m.dip, delta=DIP_TOL, msg=where)
+            self.assertAlmostEqual(ti, m.ti, delta=TI_TOL, msg=where)
+            n += 1
+        return n
+
+    def test_scalar(self):
+        for model in MODELS:
+            n = self.check(geomag.GeoMag(cof(model)), model)
+            self.assertEqual(n, len(list(grid(model))), model)
+
+    def test_registry(self):
+        "2024-12-31 is already 2025.0 and evaluated with WMM2025"
+        r = geomag.get_registry(LIB)
+        self.assertGreater(self.check(r, "WMM2020"), 0)
+        self.assertEqual(self.check(r, "WMM2025"), len(list(grid("WMM2025"))))
+
+    def test_threads(self):
+        gm = geomag.get_registry(LIB)
+        points = [p for model in MODELS for p in grid(model)]
+        expected = [gm.GeoMag(lat, lon, h, d).dec for d, h, lat, lon in points]
+        results = {}
+
+        def worker(i):
+            results[i] = [gm.GeoMag(lat, lon, h, d).dec for d, h, lat, lon in points]
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for r in results.values():
+            self.assertEqual(expected, r)
+
+
+class GeoMagRegistryTest(unittest.TestCase):
+    def setUp(self):
+        "directory with WMM2020 and a fake 2025 epoch (same coefficients)"
+        self.dir = tempfile.mkdtemp()
+        shutil.copy(WMM_FILE, self.dir)
+        with open(WMM_FILE) as src, open(os.path.join(self.dir, "WMM2025.COF"), "w") as dst:
+            lines = src.readlines()
+            lines[0] = lines[0].replace("2020.0", "2025.0").replace("WMM-2020", "WMM-2025")
+            dst.writelines(lines)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_selection(self):
+        r = geomag.GeoMagRegistry(self.dir)
+        self.assertEqual(r.epochs, (2020.0, 2025.0))
+        self.assertEqual(r.model(date(2019, 6, 1)).model, "WMM-2020")
+        self.assertEqual(r.model(date(2024, 12, 30)).model, "WMM-2020")
+        self.assertEqual(r.model(date(2025, 1, 1)).model, "WMM-2025")
+        self.assertEqual(r.model(2031.5).model, "WMM-2025")
+        self.assertEqual(r.GeoMag(50, 10, time=date(2026, 1, 1)).model, "WMM-2025")
+
+    def test_shipped(self):
+        "models shipped in lib"
+        r = geomag.get_registry(LIB)
+        self.assertIn(2025.0, r.epochs)
+        self.assertEqual(r.model(date(2024, 6, 1)).model, "WMM-2020")
+        self.assertEqual(r.model(date(2025, 1, 1)).model, "WMM-2025")
+        self.assertEqual(r.model(date(2029, 12, 1)).model, "WMM-2025")
+        self.assertEqual(r.GeoMag(54, 10, time=date(2026, 5, 1)).model, "WMM-2025")
+
+    def test_shared(self):
+        self.assertIs(geomag.get_registry(LIB), geomag.get_registry(LIB + "/"))
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            geomag.GeoMagRegistry(self.dir, "*.NONE")
+
+
+if __name__ == "__main__":
+    if "--write-reference" in sys.argv:
+        write_reference(sys.argv[-1])
+    else:
+        unittest.main()
@@ -0,0 +1,194 @@
+"""
+runs Plugin.run() against a minimal stand-in for the AvNav plugin API
+"""
+
+import os
+import sys
+import tempfile
+import time
+import types
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    import avnav_nmea
+except ImportError:
+    # only NMEAParser.checkFilter is used by the plugin, outside of AvNav accept all
+    avnav_nmea = types.ModuleType("avnav_nmea")
+    avnav_nmea.NMEAParser = type("NMEAParser", (), {"checkFilter": staticmethod(lambda s, f: True)})
+    sys.modules["avnav_nmea"] = avnav_nmea
+
+import plugin
+
+
+class Value:
+    def __init__(self, value, source="test"):
+        self.value = value
+        self.source = source
+        self.timestamp = time.monotonic()
+
+
+class Api:
+    "records what the plugin does, stops after the given number of cycles"
+
+    def __init__(self, config=None, values=None, cycles=1):
+        self.config = dict(config or {})
+        self.values = {k: Value(v) for k, v in (values or {}).items()}
+        self.cycles = cycles
+        self.status = []
+        self.nmea = []
+        self.logs = []
+        self.after_cycle = lambda: None
+
+    def registerEditableParameters(self, config, callback):
+        pass
+
+    def registerRestart(self, callback):
+        pass
+
+    def getConfigValue(self, name, default=None):
+        return str(self.config.get(name, default))
+
+    def saveConfigValues(self, values):
+        pass
+
+    def getSingleValue(self, path, includeInfo=False):
+        return self.values.get(path)
+
+    def addData(self, path, value):
+        self.values[path] = Value(value, plugin.SOURCE)
+
+    def addNMEA(self, s, **kwargs):
+        self.nmea.append(s)
+
+    def setStatus(self, status, text):
+        self.status.append((status, text))
+        self.after_cycle()
+
+    def log(self, text):
+        self.logs.append(text)
+
+    def shouldStopMainThread(self):
+        return len(self.status) >= self.cycles
+
+    def run(self):
+        self.plugin = plugin.Plugin(self)
+        self.plugin.run()
+        return self
+
+    def calculated(self, key):
+        v = self.values.get(plugin.PATH_PREFIX + key)
+        return v.value if v else None
+
+
+WIND = {
+    "gps.headingTrue": 10.0,
+    "gps.waterSpeed": 3.0,
+    "gps.windAngle": 45.0,
+    "gps.windSpeed": 8.0,
+}
+
+
+class PluginTest(unittest.TestCase):
+    def test_cycle(self):
+        api = Api({plugin.WRITE: "True"}, WIND).run()
+        self.assertIsNotNone(api.calculated("TWA"))
+        self.assertTrue(any(s.startswith("$CAMWV") and ",T," in s for s in api.nmea))
+        self.assertEqual(api.status[-1][0], "NMEA")
+
+    def test_derived_shm(self):
+        from calculated_shm import Reader
+
+        with tempfile.TemporaryDirectory() as d:
+            shm = os.path.join(d, "calculated")
+            derived = "W=add_polar((TWD,TWS),(0,1));WA=add_polar((TWD,TWS),(0,1))[0]"
+            api = Api({plugin.SHM_NAME: shm, plugin.DERIVED: derived}, WIND)
+            data = {}
+            api.after_cycle = lambda: data.update(Reader(shm).read()[2])
+            api.run()
+        self.assertIsNone(api.calculated("W"))
+        self.assertIsNotNone(api.calculated("WA"))
+        self.assertEqual(data["WA"], api.calculated("WA"))
+        self.assertNotIn("W", data)
+
+    def test_derived_error(self):
+        "errors of expressions only skip the quantity, helpers do not hang"
+        derived = "X=add_polar((TWD,TWS),(0,1))[2];Y=to360(-1e12);Z=to180(-1e300)"
+        api = Api({plugin.DERIVED: derived}, WIND).run()
+        self.assertIsNotNone(api.calculated("TWA"))
+        self.assertIsNone(api.calculated("X"))
+        self.assertAlmostEqual(api.calculated("Y"), -1e12 % 360)
+        self.assertIsNotNone(api.calculated("Z"))
+
+    def test_config_error(self):
+        api = Api({plugin.DERIVED: "VMG=STW*cos(radians(TWA)"}, WIND).run()
+        self.assertIsNotNone(api.calculated("TWA"))
+        self.assertIn(plugin.DERIVED, api.status[-1][1])
+        self.assertTrue(api.logs)
+
+    def test_wmm_migration(self):
+        position = {"gps.lat": 54.0, "gps.lon": 10.0}
+        for wmm_file in ("", "WMM2020.COF"):
+            api = Api({plugin.WMM_FILE: wmm_file}, position).run()
+            self.assertIsInstance(api.plugin.variation_model, plugin.geomag.GeoMagRegistry)
+            self.assertIsNotNone(api.calculated("VAR"))
+
+    def test_polar_missing(self):
+        api = Api({plugin.POLAR_FILE: "nope.pol"}, WIND).run()
+        self.assertIsNotNone(api.calculated("TWA"))
+        self.assertIsNone(api.calculated("TBS"))
+        self.assertIn(plugin.POLAR_FILE, api.status[-1][1])
+
+    def test_deviation_invalid(self):
+        api = Api({plugin.DEVIATION: "0:2,abc"}, WIND).run()
+        self.assertIsNotNone(api.calculated("TWA"))
+        self.assertIn(plugin.DEVIATION, api.status[-1][1])
+
+    def test_deviation_file(self):
+        "file names with a directory are used as they are, like polar_file"
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as d:
+            os.mkdir(os.path.join(d, "boat"))
+            with open(os.path.join(d, "boat", "deviation.txt"), "w") as f:
+                f.write("0 2\n180 2\n")
+            os.chdir(d)
+            try:
+                config = {plugin.DEVIATION: "boat/deviation.txt"}
+                api = Api(config, {"gps.headingCompass": 10.0}).run()
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(api.calculated("DEV"), 2)
+        self.assertEqual(api.calculated("HDM"), 12)
+
+    def test_shm_invalid(self):
+        api = Api({plugin.SHM_NAME: "/nonexistent/dir/calculated"}, WIND).run()
+        self.assertIsNotNone(api.calculated("TWA"))
+        self.assertIn(plugin.SHM_NAME, api.status[-1][1])
+
+    def test_no_timestamp(self):
+        "values without timestamp are not fresh, the period backs off"
+        config = {plugin.PERIOD: 0.01, plugin.PERIOD_MAX: 1}
+        api = Api(config, WIND, cycles=3)
+        for v in api.values.values():
+            v.timestamp = 0
+        api.run()
+        self.assertIn("period 0.08s", api.status[-1][1])
+
+    def test_crash_closes_shm(self):
+        with tempfile.TemporaryDirectory() as d:
+            shm = os.path.join(d, "calculated")
+            api = Api({plugin.SHM_NAME: shm}, WIND)
+
+            def crash():
+                raise RuntimeError("crash")
+
+            api.after_cycle = crash
+            with self.assertRaises(RuntimeError):
+                api.run()
+            self.assertFalse(os.path.exists(shm))
+
+
+if __name__ == "__main__":
+    unittest.main()
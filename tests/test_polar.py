@@ -0,0 +1,79 @@
+import os
+import sys
+import tempfile
+import unittest
+from math import cos, radians
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib"))
+from polar import Polar
+
+POL = """\
+TWA\\TWS\t6\t10\t20
+45\t4.0\t5.0\t6.0
+90\t5.0\t7.0\t8.0
+135\t4.0\t6.0\t9.0
+180\t3.0\t5.0\t8.0
+"""
+
+
+class PolarTest(unittest.TestCase):
+    def setUp(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".pol", delete=False) as f:
+            f.write(POL)
+        self.polar = Polar.load(f.name)
+        os.unlink(f.name)
+
+    def test_speed(self):
+        p = self.polar
+        self.assertAlmostEqual(p.speed(90, 10), 7)
+        self.assertAlmostEqual(p.speed(-90, 10), 7)
+        self.assertAlmostEqual(p.speed(270, 10), 7)
+        self.assertAlmostEqual(p.speed(90, 8), 6)
+        self.assertAlmostEqual(p.speed(67.5, 6), 4.5)
+        self.assertAlmostEqual(p.speed(90, 30), 8)
+        self.assertAlmostEqual(p.speed(0, 10), 0)
+        self.assertAlmostEqual(p.speed(90, 0), 0)
+        self.assertAlmostEqual(p.speed(90, 3), 2.5)
+
+    def test_unit(self):
+        p = Polar([90], [10], [[7]], unit=2.0)
+        self.assertAlmostEqual(p.speed(90, 5), 3.5)
+
+    def test_targets(self):
+        p = self.polar
+        t = p.targets(90, 10, stw=6.3)
+        self.assertAlmostEqual(t["TBS"], 7)
+        self.assertAlmostEqual(t["PPC"], 90)
+        self.assertTrue(0 < t["TUA"] < 90 < t["TDA"] <= 180)
+        best_up = max(p.speed(a, 10) * cos(radians(a)) for a in range(0, 91))
+        best_down = max(-p.speed(a, 10) * cos(radians(a)) for a in range(90, 181))
+        self.assertAlmostEqual(t["TUV"], best_up)
+        self.assertAlmostEqual(t["TDV"], best_down)
+        self.assertAlmostEqual(t["TUV"], p.speed(t["TUA"], 10) * cos(radians(t["TUA"])))
+
+    def test_low_wind(self):
+        p = self.polar
+        for tws in (0, 0.25, 1, 3, 5.9, 6):
+            t = p.targets(0, tws)
+            self.assertTrue(t["TUA"] < 90 < t["TDA"], f"tws={tws} {t}")
+        self.assertEqual(p.vmg_targets(0.25)[::2], p.vmg_targets(6)[::2])
+
+    def test_invalid(self):
+        for text in ("", "TWA\\TWS 6\n", "TWA 6 6\n90 1 2\n", "TWA 6\n90 1\n90 2\n", "TWA 6 8\n90 1\n"):
+            with tempfile.NamedTemporaryFile("w", suffix=".pol", delete=False) as f:
+                f.write(text)
+            try:
+                with self.assertRaises(ValueError, msg=text):
+                    Polar.load(f.name)
+            finally:
+                os.unlink(f.name)
+
+    def test_batch(self):
+        p = self.polar
+        b = p.batch([90, -45], [10, 20])
+        self.assertEqual(b, [p.targets(90, 10), p.targets(-45, 20)])
+        self.assertNotIn("PPC", b[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lib"))
+from scheduler import AdaptivePeriod
+
+
+class AdaptivePeriodTest(unittest.TestCase):
+    def test_moving(self):
+        s = AdaptivePeriod(1, 30, 0.3)
+        self.assertEqual([s.update(True, 2.0, None) for _ in range(3)], [1, 1, 1])
+        self.assertEqual(s.update(True, None, None), 1)  # speed unknown
+
+    def test_backoff(self):
+        s = AdaptivePeriod(1, 30, 0.3)
+        self.assertEqual([s.update(True, 0.1, 0.0) for _ in range(7)], [2, 4, 8, 16, 30, 30, 30])
+        s = AdaptivePeriod(0.5, 3, 0.3)
+        self.assertEqual([s.update(False, 5.0, None) for _ in range(4)], [1, 2, 3, 3])
+
+    def test_snap_back_on_motion(self):
+        s = AdaptivePeriod(1, 30, 0.3)
+        for _ in range(5):
+            s.update(True, 0.1, None)
+        self.assertEqual(s.update(True, 1.0, None), 1)
+        self.assertEqual(s.update(True, None, -1.0), 1)
+
+    def test_snap_back_on_fresh_data(self):
+        s = AdaptivePeriod(1, 30, 0.3)
+        self.assertEqual([s.update(False, None, None) for _ in range(3)], [2, 4, 8])
+        # fresh data after a gap, even while stationary
+        self.assertEqual(s.update(True, 0.0, None), 1)
+        self.assertEqual(s.update(True, 0.0, None), 2)
+
+    def test_disabled(self):
+        for period_max in (1, 0.5, 0, -1):
+            s = AdaptivePeriod(1, period_max, 0.3)
+            self.assertEqual([s.update(False, 0.0, None) for _ in range(3)], [1, 1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()